@@ -3,19 +3,356 @@ RoadTemplates - Email and Document Template System for BlackRoad
 Jinja2-based templating with email, PDF, and multi-language support.
 """
 
+from collections import ChainMap, OrderedDict
+from collections.abc import Mapping
 from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
-from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+from functools import lru_cache, partial
+from types import MappingProxyType
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple, Union
+import ast
+import copy
 import hashlib
 import html
+import itertools
 import json
 import logging
 import os
 import re
+import threading
+
+try:
+    import jinja2
+except ImportError:  # pragma: no cover - optional dependency
+    jinja2 = None
 
 logger = logging.getLogger(__name__)
 
+if jinja2 is not None:
+    class _BlankUndefined(jinja2.ChainableUndefined):
+        """Undefined that renders as "" and tolerates attribute chains, like the built-in renderer."""
+
+    class _TemplateEnvironment(jinja2.Environment):
+        """Environment resolving user.name against mappings by key before attribute."""
+
+        def getattr(self, obj: Any, attribute: str) -> Any:
+            if isinstance(obj, Mapping):
+                if attribute in obj:
+                    return obj[attribute]
+                return self.undefined(obj=obj, name=attribute)
+            return super().getattr(obj, attribute)
+
+
+def _blank_undefined_filter(fn: Callable) -> Callable:
+    """Wrap a filter so Jinja2 Undefined values reach it as ""."""
+    def wrapped(value: Any, *args: Any, **kwargs: Any) -> Any:
+        if isinstance(value, jinja2.Undefined):
+            value = ""
+        return fn(value, *args, **kwargs)
+    return wrapped
+
+# Jinja2-style syntax
+_FOR_RE = re.compile(r"{%\s*for\s+(\w+)\s+in\s+(\w+(?:\.\w+)*)\s*%}(.*?){%\s*endfor\s*%}", re.DOTALL)
+_IF_RE = re.compile(r"{%\s*if\s+(.+?)\s*%}(.*?)(?:{%\s*else\s*%}(.*?))?{%\s*endif\s*%}", re.DOTALL)
+_VAR_RE = re.compile(r"{{\s*(.+?)\s*}}")
+
+# Mustache-style syntax
+_SECTION_RE = re.compile(r"{{#(\w+)}}(.*?){{/\1}}", re.DOTALL)
+_INV_RE = re.compile(r"{{\^(\w+)}}(.*?){{/\1}}", re.DOTALL)
+_MUSTACHE_VAR_RE = re.compile(r"{{(\w+(?:\.\w+)*)}}")
+_RAW_RE = re.compile(r"{{{(\w+(?:\.\w+)*)}}}")
+_MUSTACHE_TAG_RE = re.compile(_RAW_RE.pattern + "|" + _MUSTACHE_VAR_RE.pattern)
+
+_SLUGIFY_RE = re.compile(r"[^a-z0-9]+")
+
+
+def _maybe_escape(s: str) -> str:
+    """HTML-escape a string, returning it untouched if nothing needs escaping."""
+    if "&" in s or "<" in s or ">" in s or '"' in s or "'" in s:
+        return html.escape(s)
+    return s
+
+
+# Stamped on templates by TemplateStore.save; unique across all templates
+_SAVE_REVISIONS = itertools.count(1)
+
+_FREEZABLE_SCALARS = (str, int, float, bool, type(None), datetime)
+
+
+def _freeze(value: Any) -> Any:
+    """Convert a context value into a hashable render-cache key component.
+
+    Raises TypeError for values that cannot be keyed safely (arbitrary
+    objects may be mutated without their hash changing).
+    """
+    # Tag every component with its type: 1, 1.0 and True (or a list and a
+    # tuple) compare equal but render differently.
+    if isinstance(value, _FREEZABLE_SCALARS):
+        return (type(value), value)
+    if isinstance(value, Mapping):
+        return ("{", tuple(sorted(((_freeze(k), _freeze(v)) for k, v in value.items()), key=repr)))
+    if isinstance(value, list):
+        return ("[", tuple(_freeze(v) for v in value))
+    if isinstance(value, tuple):
+        return ("(", tuple(_freeze(v) for v in value))
+    raise TypeError(f"Unhashable context value: {type(value).__name__}")
+
+
+@lru_cache(maxsize=1024)
+def _slugify(s: str) -> str:
+    """Lowercase a string and collapse non-alphanumeric runs to dashes."""
+    return _SLUGIFY_RE.sub("-", s.lower()).strip("-")
+
+
+@lru_cache(maxsize=512)
+def _parse_filter_expr(filter_expr: str) -> Tuple[str, Optional[Tuple[Any, ...]]]:
+    """Split a filter expression into its name and literal arguments.
+
+    Arguments are None when the expression has no argument list or the
+    arguments are not plain literals.
+    """
+    parts = filter_expr.split("(", 1)
+    filter_name = parts[0].strip()
+    if len(parts) == 1:
+        return filter_name, None
+
+    args_str = parts[1].rstrip(")").strip().rstrip(",")
+    if not args_str:
+        return filter_name, ()
+    try:
+        args = ast.literal_eval(f"({args_str},)")
+    except (ValueError, SyntaxError):
+        return filter_name, None
+    return filter_name, args
+
+
+def _make_accessor(keys: Tuple[str, ...]) -> Callable[[Mapping[str, Any]], Any]:
+    """Build a function resolving a dotted path (e.g. user.name) in a context.
+
+    Missing keys and attributes resolve to "".
+    """
+    first, rest = keys[0], keys[1:]
+    if not rest:
+        return lambda context: context.get(first, "")
+
+    if len(rest) == 1:
+        (second,) = rest
+
+        def access(context: Mapping[str, Any]) -> Any:
+            value = context.get(first, "")
+            if isinstance(value, Mapping):
+                return value.get(second, "")
+            return getattr(value, second, "")
+        return access
+
+    def access(context: Mapping[str, Any]) -> Any:
+        value = context.get(first, "")
+        for key in rest:
+            if isinstance(value, Mapping):
+                value = value.get(key, "")
+            else:
+                value = getattr(value, key, "")
+        return value
+    return access
+
+
+@lru_cache(maxsize=2048)
+def _parse_var_expr(
+    var_expr: str,
+) -> Tuple[Callable[[Mapping[str, Any]], Any], Tuple[Tuple[str, Optional[Tuple[Any, ...]]], ...]]:
+    """Split a variable expression into a path accessor and parsed filters."""
+    parts = var_expr.split("|")
+    accessor = _make_accessor(tuple(parts[0].strip().split(".")))
+    filters = tuple(_parse_filter_expr(f.strip()) for f in parts[1:])
+    return accessor, filters
+
+
+# Compiled {% if %} conditions
+_COMPARE_OPS = ("==", "!=", ">=", "<=", ">", "<")
+
+
+def _value_text(value: Any) -> str:
+    """Render a value the way a {{ variable }} would be."""
+    if value is None:
+        return ""
+    if type(value) is str:
+        return value
+    return str(value)
+
+
+def _cond_truthy(text: str) -> bool:
+    """Template truthiness of a rendered value: "", "None", "0" and "False" are false."""
+    return bool(text) and text not in ("None", "0", "False")
+
+
+def _cond_compare(op: str, left: str, right: str) -> bool:
+    """Compare a rendered value with a literal: equality on text, ordering numerically."""
+    if op == "==":
+        return left == right
+    if op == "!=":
+        return left != right
+    if op == ">=":
+        return float(left) >= float(right)
+    if op == "<=":
+        return float(left) <= float(right)
+    if op == ">":
+        return float(left) > float(right)
+    return float(left) < float(right)
+
+
+_COND_HELPERS = {
+    "__builtins__": {},
+    "_cond_truthy": _cond_truthy,
+    "_cond_compare": _cond_compare,
+}
+
+
+def _helper_call(name: str, *args: ast.expr) -> ast.Call:
+    """Build an AST call to a condition helper."""
+    return ast.Call(func=ast.Name(id=name, ctx=ast.Load()), args=list(args), keywords=[])
+
+
+def _cond_variable(var_expr: str) -> ast.Call:
+    """Build an AST call rendering a variable expression against ctx."""
+    return _helper_call("_var", ast.Constant(value=var_expr), ast.Name(id="ctx", ctx=ast.Load()))
+
+
+def _cond_node(condition: str) -> ast.expr:
+    """Build the AST for a condition.
+
+    Follows the template condition grammar: a leading "not" negates the
+    rest, then the text is split on the first " and ", then " or ".
+    Comparisons take a variable expression on the left and a literal
+    (quotes optional) on the right.
+    """
+    condition = condition.strip()
+
+    if condition.startswith("not "):
+        return ast.UnaryOp(op=ast.Not(), operand=_cond_node(condition[4:]))
+
+    if " and " in condition:
+        left, right = condition.split(" and ", 1)
+        return ast.BoolOp(op=ast.And(), values=[_cond_node(left), _cond_node(right)])
+
+    if " or " in condition:
+        left, right = condition.split(" or ", 1)
+        return ast.BoolOp(op=ast.Or(), values=[_cond_node(left), _cond_node(right)])
+
+    for op in _COMPARE_OPS:
+        if op in condition:
+            parts = condition.split(op)
+            return _helper_call(
+                "_cond_compare",
+                ast.Constant(value=op),
+                _cond_variable(parts[0]),
+                ast.Constant(value=parts[1].strip().strip("'\"")),
+            )
+
+    return _helper_call("_cond_truthy", _cond_variable(condition))
+
+
+@lru_cache(maxsize=1024)
+def _compile_condition(condition: str) -> Callable[[Mapping[str, Any], Callable], bool]:
+    """Compile an {% if %} condition into a function of (context, render_variable).
+
+    The condition is parsed once into a Python AST and compiled to a
+    lambda with no builtins; render_variable is the engine's
+    _render_variable, used for every variable operand.
+    """
+    fn = ast.Lambda(
+        args=ast.arguments(
+            posonlyargs=[],
+            args=[ast.arg(arg="ctx"), ast.arg(arg="_var")],
+            kwonlyargs=[], kw_defaults=[], defaults=[],
+        ),
+        body=_cond_node(condition),
+    )
+    code = compile(ast.fix_missing_locations(ast.Expression(body=fn)), "<condition>", "eval")
+    return eval(code, _COND_HELPERS)
+
+
+# Compiled Jinja2-style ops:
+#   (_OP_TEXT, text)
+#   (_OP_VAR, var_expr)
+#   (_OP_IF, condition, then_ops, else_ops)
+#   (_OP_FOR, var_name, items_keys, body_ops)
+_OP_TEXT = "text"
+_OP_VAR = "var"
+_OP_IF = "if"
+_OP_FOR = "for"
+
+# Marks where an extracted for-loop sat while if-blocks and variables are
+# compiled; built from Unicode noncharacters so it cannot clash with text.
+_LOOP_MARK_RE = re.compile(r"\ufdd0(\d+)\ufdd1")
+_LOOP_OR_VAR_RE = re.compile(_LOOP_MARK_RE.pattern + "|" + _VAR_RE.pattern)
+
+
+def _compile_inline(text: str, loops: List[Tuple[Any, ...]]) -> List[Tuple[Any, ...]]:
+    """Compile text containing only variables and loop markers."""
+    ops = []
+    last = 0
+    for match in _LOOP_OR_VAR_RE.finditer(text):
+        if match.start() > last:
+            ops.append((_OP_TEXT, text[last:match.start()]))
+        loop_index, var_expr = match.groups()
+        if loop_index is not None:
+            ops.append(loops[int(loop_index)])
+        else:
+            ops.append((_OP_VAR, var_expr))
+        last = match.end()
+    if last < len(text):
+        ops.append((_OP_TEXT, text[last:]))
+    return ops
+
+
+def _compile_blocks(text: str, loops: List[Tuple[Any, ...]]) -> Tuple[Tuple[Any, ...], ...]:
+    """Compile if-blocks, variables and loop markers in text."""
+    ops = []
+    last = 0
+    for match in _IF_RE.finditer(text):
+        ops.extend(_compile_inline(text[last:match.start()], loops))
+        ops.append((
+            _OP_IF,
+            match.group(1),
+            _compile_blocks(match.group(2), loops),
+            _compile_blocks(match.group(3) or "", loops),
+        ))
+        last = match.end()
+    ops.extend(_compile_inline(text[last:], loops))
+    return tuple(ops)
+
+
+def _has_loop(ops: Tuple[Tuple[Any, ...], ...]) -> bool:
+    """Whether compiled ops contain a for-loop at any depth."""
+    for op in ops:
+        if op[0] == _OP_FOR:
+            return True
+        if op[0] == _OP_IF and (_has_loop(op[2]) or _has_loop(op[3])):
+            return True
+    return False
+
+
+@lru_cache(maxsize=512)
+def _compile_jinja2(template_str: str) -> Tuple[Tuple[Any, ...], ...]:
+    """Compile a Jinja2-style template into ops for TemplateEngine._exec.
+
+    Loops are resolved first, then if-blocks, then variables, matching the
+    order of the original pass-based renderer.
+    """
+    loops = []
+
+    def extract_loop(match: re.Match) -> str:
+        loops.append((
+            _OP_FOR,
+            match.group(1),
+            tuple(match.group(2).split(".")),
+            _compile_jinja2(match.group(3)),
+        ))
+        return f"\ufdd0{len(loops) - 1}\ufdd1"
+
+    return _compile_blocks(_FOR_RE.sub(extract_loop, template_str), loops)
+
 
 class TemplateType(str, Enum):
     """Types of templates."""
@@ -63,13 +400,48 @@ class Template:
     updated_at: datetime = field(default_factory=datetime.now)
     metadata: Dict[str, Any] = field(default_factory=dict)
 
+    # Derived from variables, recomputed when version changes
+    _required: FrozenSet[str] = field(default=frozenset(), init=False, repr=False, compare=False)
+    _defaults: Dict[str, Any] = field(default_factory=dict, init=False, repr=False, compare=False)
+    _indexed_version: Optional[int] = field(default=None, init=False, repr=False, compare=False)
+
+    # Generated render function (see TemplateEngine.try_specialize) and the source it was built from
+    _fast_render: Optional[Callable] = field(default=None, init=False, repr=False, compare=False)
+    _fast_render_key: Optional[tuple] = field(default=None, init=False, repr=False, compare=False)
+
+    # Set by TemplateStore.save on every save; part of the render cache key
+    _revision: int = field(default=0, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._index_variables()
+
+    def _index_variables(self) -> None:
+        """Cache required variable names and defaults."""
+        self._required = frozenset(v.name for v in self.variables if v.required)
+        self._defaults = {v.name: v.default for v in self.variables if v.default is not None}
+        self._indexed_version = self.version
+
+    @property
+    def required_variables(self) -> FrozenSet[str]:
+        """Names of required variables."""
+        if self._indexed_version != self.version:
+            self._index_variables()
+        return self._required
+
+    @property
+    def variable_defaults(self) -> Mapping[str, Any]:
+        """Default values for variables (read-only)."""
+        if self._indexed_version != self.version:
+            self._index_variables()
+        return self._defaults
+
     def get_required_variables(self) -> Set[str]:
         """Get names of required variables."""
-        return {v.name for v in self.variables if v.required}
+        return set(self.required_variables)
 
     def get_variable_defaults(self) -> Dict[str, Any]:
         """Get default values for variables."""
-        return {v.name: v.default for v in self.variables if v.default is not None}
+        return dict(self.variable_defaults)
 
 
 @dataclass
@@ -80,18 +452,57 @@ class RenderedTemplate:
     body: str = ""
     html_body: Optional[str] = None
     locale: str = "en"
-    rendered_at: datetime = field(default_factory=datetime.now)
+    rendered_at: Optional[datetime] = field(default=None, compare=False)
     variables_used: Dict[str, Any] = field(default_factory=dict)
 
 
+def _get_rendered_at(self: RenderedTemplate) -> datetime:
+    """When the template was rendered, stamped on first access."""
+    if self._rendered_at is None:
+        self._rendered_at = datetime.now()
+    return self._rendered_at
+
+
+def _set_rendered_at(self: RenderedTemplate, value: Optional[datetime]) -> None:
+    self._rendered_at = value
+
+
+# rendered_at stays a regular dataclass field (constructor argument, repr,
+# fields()) but is read through a property so the timestamp is only taken
+# when someone asks for it.
+RenderedTemplate.rendered_at = property(_get_rendered_at, _set_rendered_at)
+
+
 class TemplateEngine:
     """Template rendering engine."""
 
-    def __init__(self):
+    def __init__(self, use_legacy: bool = False, cache_size: int = 1000):
         self.filters: Dict[str, Callable] = {}
         self.globals: Dict[str, Any] = {}
         self._register_default_filters()
 
+        # Real Jinja2 when available; the built-in subset renderer otherwise
+        if not use_legacy and jinja2 is None:
+            logger.warning("jinja2 is not installed; falling back to the built-in template renderer")
+        self.use_legacy = use_legacy or jinja2 is None
+        self._env = None
+        self.cache_size = cache_size
+        self.revision = 0  # bumped whenever filters or globals change
+        self._compiled: "OrderedDict[str, Any]" = OrderedDict()  # source -> compiled jinja2.Template (LRU)
+        self._compiled_lock = threading.Lock()
+        if not self.use_legacy:
+            self._env = _TemplateEnvironment(
+                autoescape=False,
+                trim_blocks=True,
+                lstrip_blocks=True,
+                auto_reload=False,
+                undefined=_BlankUndefined,
+                finalize=lambda v: "" if v is None else v,
+            )
+            for name, fn in self.filters.items():
+                self._env.filters[name] = _blank_undefined_filter(fn)
+            self._env.globals.update(self.globals)
+
     def _register_default_filters(self) -> None:
         """Register default template filters."""
         self.filters["upper"] = str.upper
@@ -107,239 +518,296 @@ class TemplateEngine:
         self.filters["truncate"] = lambda s, n=50: s[:n] + "..." if len(s) > n else s
         self.filters["json"] = lambda v: json.dumps(v)
         self.filters["nl2br"] = lambda s: s.replace("\n", "<br>")
-        self.filters["slugify"] = lambda s: re.sub(r"[^a-z0-9]+", "-", s.lower()).strip("-")
+        self.filters["slugify"] = _slugify
+
+    def _check_writable(self) -> None:
+        """Raise if this is the shared, read-only default engine."""
+        if isinstance(self.filters, MappingProxyType):
+            raise TypeError(
+                "The shared default TemplateEngine is read-only; "
+                "call clone() and customise the copy instead"
+            )
 
     def add_filter(self, name: str, fn: Callable) -> None:
         """Add a custom filter."""
+        self._check_writable()
         self.filters[name] = fn
+        self.revision += 1
+        if self._env is not None:
+            self._env.filters[name] = _blank_undefined_filter(fn)
 
     def add_global(self, name: str, value: Any) -> None:
         """Add a global template variable."""
+        self._check_writable()
         self.globals[name] = value
+        self.revision += 1
+        if self._env is not None:
+            self._env.globals[name] = value
+
+    def clone(self) -> "TemplateEngine":
+        """Return an engine with writable copies of this engine's filters and globals."""
+        engine = TemplateEngine(use_legacy=self.use_legacy, cache_size=self.cache_size)
+        for name, fn in self.filters.items():
+            engine.add_filter(name, fn)
+        for name, value in self.globals.items():
+            engine.add_global(name, value)
+        return engine
 
     def _apply_filter(self, value: Any, filter_expr: str) -> Any:
         """Apply a filter expression to a value."""
-        parts = filter_expr.split("(", 1)
-        filter_name = parts[0].strip()
+        return self._call_filter(value, *_parse_filter_expr(filter_expr))
 
-        if filter_name not in self.filters:
+    def _call_filter(self, value: Any, filter_name: str, args: Optional[Tuple[Any, ...]]) -> Any:
+        """Apply a parsed filter to a value."""
+        filter_fn = self.filters.get(filter_name)
+        if filter_fn is None:
             return value
 
-        filter_fn = self.filters[filter_name]
-
-        if len(parts) > 1:
-            # Parse arguments
-            args_str = parts[1].rstrip(")")
-            try:
-                args = eval(f"[{args_str}]")
-                return filter_fn(value, *args)
-            except:
-                return filter_fn(value)
-        else:
-            return filter_fn(value)
+        if args:
+            return filter_fn(value, *args)
+        return filter_fn(value)
 
     def _render_variable(self, var_expr: str, context: Dict[str, Any]) -> str:
         """Render a single variable expression."""
-        # Split by | for filters
-        parts = var_expr.split("|")
-        var_name = parts[0].strip()
-
-        # Handle nested access (e.g., user.name)
-        value = context
-        for key in var_name.split("."):
-            if isinstance(value, dict):
-                value = value.get(key, "")
-            else:
-                value = getattr(value, key, "")
+        accessor, filters = _parse_var_expr(var_expr)
+        value = accessor(context)
 
         # Apply filters
-        for filter_expr in parts[1:]:
-            value = self._apply_filter(value, filter_expr.strip())
+        for filter_name, args in filters:
+            value = self._call_filter(value, filter_name, args)
 
-        return str(value) if value is not None else ""
+        return _value_text(value)
 
     def _evaluate_condition(self, condition: str, context: Dict[str, Any]) -> bool:
         """Evaluate a condition expression."""
-        condition = condition.strip()
-
-        # Handle not
-        if condition.startswith("not "):
-            return not self._evaluate_condition(condition[4:], context)
-
-        # Handle and/or
-        if " and " in condition:
-            parts = condition.split(" and ", 1)
-            return self._evaluate_condition(parts[0], context) and self._evaluate_condition(parts[1], context)
-
-        if " or " in condition:
-            parts = condition.split(" or ", 1)
-            return self._evaluate_condition(parts[0], context) or self._evaluate_condition(parts[1], context)
-
-        # Handle comparison operators
-        for op in ["==", "!=", ">=", "<=", ">", "<"]:
-            if op in condition:
-                parts = condition.split(op)
-                left = self._render_variable(parts[0], context)
-                right = parts[1].strip().strip("'\"")
-                if op == "==":
-                    return left == right
-                elif op == "!=":
-                    return left != right
-                elif op == ">=":
-                    return float(left) >= float(right)
-                elif op == "<=":
-                    return float(left) <= float(right)
-                elif op == ">":
-                    return float(left) > float(right)
-                elif op == "<":
-                    return float(left) < float(right)
-
-        # Simple truthiness check
-        value = self._render_variable(condition, context)
-        return bool(value) and value != "None" and value != "0" and value != "False"
+        return _compile_condition(condition.strip())(context, self._render_variable)
+
+    def _exec(self, ops: Tuple[Tuple[Any, ...], ...], context: Dict[str, Any], out: List[str]) -> None:
+        """Run compiled Jinja2-style ops against a context, appending output to out."""
+        append = out.append
+        for op in ops:
+            kind = op[0]
+            if kind == _OP_TEXT:
+                append(op[1])
+            elif kind == _OP_VAR:
+                append(self._render_variable(op[1], context))
+            elif kind == _OP_IF:
+                branch = op[2] if self._evaluate_condition(op[1], context) else op[3]
+                self._exec(branch, context, out)
+            else:
+                _, var_name, items_keys, body = op
+
+                # Get items
+                items = context
+                for key in items_keys:
+                    items = items.get(key, []) if isinstance(items, Mapping) else getattr(items, key, [])
+
+                # Render loop, reusing the compiled body for every item
+                items = items or []
+                for i, item in enumerate(items):
+                    loop_context = ChainMap({
+                        var_name: item,
+                        "loop": {
+                            "index": i + 1,
+                            "index0": i,
+                            "first": i == 0,
+                            "last": i == len(items) - 1,
+                            "length": len(items)
+                        }
+                    }, context)
+                    self._exec(body, loop_context, out)
 
     def render_jinja2(self, template_str: str, context: Dict[str, Any]) -> str:
         """Render Jinja2-style template."""
-        result = template_str
-        full_context = {**self.globals, **context}
-
-        # Process for loops {% for item in items %}...{% endfor %}
-        for_pattern = r"{%\s*for\s+(\w+)\s+in\s+(\w+(?:\.\w+)*)\s*%}(.*?){%\s*endfor\s*%}"
-        for match in re.finditer(for_pattern, result, re.DOTALL):
-            var_name = match.group(1)
-            items_expr = match.group(2)
-            loop_body = match.group(3)
-
-            # Get items
-            items = full_context
-            for key in items_expr.split("."):
-                items = items.get(key, []) if isinstance(items, dict) else getattr(items, key, [])
-
-            # Render loop
-            rendered_loops = []
-            for i, item in enumerate(items or []):
-                loop_context = {
-                    **full_context,
-                    var_name: item,
-                    "loop": {
-                        "index": i + 1,
-                        "index0": i,
-                        "first": i == 0,
-                        "last": i == len(items) - 1,
-                        "length": len(items)
-                    }
-                }
-                rendered_loops.append(self.render_jinja2(loop_body, loop_context))
-
-            result = result.replace(match.group(0), "".join(rendered_loops))
-
-        # Process if/else {% if condition %}...{% else %}...{% endif %}
-        if_pattern = r"{%\s*if\s+(.+?)\s*%}(.*?)(?:{%\s*else\s*%}(.*?))?{%\s*endif\s*%}"
-        for match in re.finditer(if_pattern, result, re.DOTALL):
-            condition = match.group(1)
-            if_body = match.group(2)
-            else_body = match.group(3) or ""
-
-            if self._evaluate_condition(condition, full_context):
-                rendered = self.render_jinja2(if_body, full_context)
-            else:
-                rendered = self.render_jinja2(else_body, full_context)
-
-            result = result.replace(match.group(0), rendered)
-
-        # Process variables {{ variable }}
-        var_pattern = r"{{\s*(.+?)\s*}}"
-        for match in re.finditer(var_pattern, result):
-            var_expr = match.group(1)
-            rendered = self._render_variable(var_expr, full_context)
-            result = result.replace(match.group(0), rendered)
-
-        return result
-
-    def render_mustache(self, template_str: str, context: Dict[str, Any]) -> str:
-        """Render Mustache-style template."""
-        result = template_str
-        full_context = {**self.globals, **context}
-
-        # Process sections {{#section}}...{{/section}}
-        section_pattern = r"{{#(\w+)}}(.*?){{/\1}}"
-        for match in re.finditer(section_pattern, result, re.DOTALL):
-            var_name = match.group(1)
+        if "{{" not in template_str and "{%" not in template_str:
+            return template_str
+        full_context = ChainMap(context, self.globals)
+        out: List[str] = []
+        self._exec(_compile_jinja2(template_str), full_context, out)
+        return "".join(out)
+
+    def _expand_section_match(self, context: Dict[str, Any]) -> Callable[[re.Match], str]:
+        """Build a substitution callback that expands a Mustache section."""
+        def expand(match: re.Match) -> str:
             section_body = match.group(2)
-            value = full_context.get(var_name)
+            value = context.get(match.group(1))
 
             if isinstance(value, list):
                 rendered_sections = []
                 for item in value:
-                    section_context = {**full_context, **item} if isinstance(item, dict) else {**full_context, ".": item}
+                    section_context = ChainMap(item if isinstance(item, dict) else {".": item}, context)
                     rendered_sections.append(self.render_mustache(section_body, section_context))
-                result = result.replace(match.group(0), "".join(rendered_sections))
-            elif value:
-                result = result.replace(match.group(0), self.render_mustache(section_body, full_context))
-            else:
-                result = result.replace(match.group(0), "")
+                return "".join(rendered_sections)
+            if value:
+                return self.render_mustache(section_body, context)
+            return ""
+        return expand
+
+    def _expand_inverted_match(self, context: Dict[str, Any]) -> Callable[[re.Match], str]:
+        """Build a substitution callback that expands an inverted Mustache section."""
+        def expand(match: re.Match) -> str:
+            value = context.get(match.group(1))
+            if not value or (isinstance(value, list) and len(value) == 0):
+                return self.render_mustache(match.group(2), context)
+            return ""
+        return expand
 
-        # Process inverted sections {{^section}}...{{/section}}
-        inv_pattern = r"{{\^(\w+)}}(.*?){{/\1}}"
-        for match in re.finditer(inv_pattern, result, re.DOTALL):
-            var_name = match.group(1)
-            section_body = match.group(2)
-            value = full_context.get(var_name)
+    def render_mustache(self, template_str: str, context: Dict[str, Any]) -> str:
+        """Render Mustache-style template."""
+        if "{{" not in template_str:
+            return template_str
+        full_context = ChainMap(context, self.globals)
 
-            if not value or (isinstance(value, list) and len(value) == 0):
-                result = result.replace(match.group(0), self.render_mustache(section_body, full_context))
-            else:
-                result = result.replace(match.group(0), "")
-
-        # Process variables {{variable}}
-        var_pattern = r"{{(\w+(?:\.\w+)*)}}"
-        for match in re.finditer(var_pattern, result):
-            var_expr = match.group(1)
-            rendered = self._render_variable(var_expr, full_context)
-            result = result.replace(match.group(0), html.escape(rendered))
-
-        # Process unescaped variables {{{variable}}}
-        raw_pattern = r"{{{(\w+(?:\.\w+)*)}}}"
-        for match in re.finditer(raw_pattern, result):
-            var_expr = match.group(1)
-            rendered = self._render_variable(var_expr, full_context)
-            result = result.replace(match.group(0), rendered)
+        # Process sections {{#section}}...{{/section}}
+        result = _SECTION_RE.sub(self._expand_section_match(full_context), template_str)
 
-        return result
+        # Process inverted sections {{^section}}...{{/section}}
+        result = _INV_RE.sub(self._expand_inverted_match(full_context), result)
+
+        # Process unescaped {{{variable}}} and escaped {{variable}} in one scan
+        pieces = []
+        last = 0
+        for match in _MUSTACHE_TAG_RE.finditer(result):
+            pieces.append(result[last:match.start()])
+            raw_expr, var_expr = match.groups()
+            if raw_expr is not None:
+                pieces.append(self._render_variable(raw_expr, full_context))
+            else:
+                pieces.append(_maybe_escape(self._render_variable(var_expr, full_context)))
+            last = match.end()
+        pieces.append(result[last:])
+        return "".join(pieces)
+
+    def _compile(self, source: str) -> Any:
+        """Compile a Jinja2 source string, reusing recent compilations."""
+        with self._compiled_lock:
+            compiled = self._compiled.get(source)
+            if compiled is not None:
+                self._compiled.move_to_end(source)
+                return compiled
+
+        compiled = self._env.from_string(source)
+        with self._compiled_lock:
+            self._compiled[source] = compiled
+            while len(self._compiled) > self.cache_size:
+                self._compiled.popitem(last=False)
+        return compiled
+
+    def try_specialize(self, template: Template) -> Optional[Callable]:
+        """Generate a Python render function for a loop-free Jinja2-style template.
+
+        The function takes (context, engine) and returns the rendered
+        (subject, body, html_body). Returns None when the template is not
+        rendered by the built-in renderer or contains {% for %} loops.
+        """
+        if not self.use_legacy or template.format != TemplateFormat.JINJA2:
+            return None
+
+        parts = [template.subject or None, template.body, template.html_body or None]
+        compiled = [_compile_jinja2(part) if part is not None else None for part in parts]
+        if any(ops is not None and _has_loop(ops) for ops in compiled):
+            return None
+
+        namespace: Dict[str, Any] = {"__builtins__": {}, "_text": _value_text}
+
+        def emit(ops: Tuple[Tuple[Any, ...], ...]) -> str:
+            pieces = []
+            for op in ops:
+                kind = op[0]
+                if kind == _OP_TEXT:
+                    pieces.append(repr(op[1]))
+                elif kind == _OP_VAR:
+                    accessor, filters = _parse_var_expr(op[1])
+                    if filters:
+                        pieces.append(f"engine._render_variable({op[1]!r}, ctx)")
+                    else:
+                        name = f"_a{len(namespace)}"
+                        namespace[name] = accessor
+                        pieces.append(f"_text({name}(ctx))")
+                else:
+                    name = f"_c{len(namespace)}"
+                    namespace[name] = _compile_condition(op[1].strip())
+                    test = f"{name}(ctx, engine._render_variable)"
+                    pieces.append(f"({emit(op[2])} if {test} else {emit(op[3])})")
+            if not pieces:
+                return "''"
+            if len(pieces) == 1:
+                return pieces[0]
+            return f"''.join(({', '.join(pieces)}))"
+
+        exprs = [emit(ops) if ops is not None else "None" for ops in compiled]
+        source = f"def _render(ctx, engine):\n    return ({', '.join(exprs)})\n"
+        exec(compile(source, f"<template {template.id}>", "exec"), namespace)
+        return namespace["_render"]
+
+    def _specialized(self, template: Template) -> Optional[Callable]:
+        """Return the template's generated render function, rebuilding it when its source changes."""
+        key = (template.format, template.subject, template.body, template.html_body)
+        if template._fast_render_key != key:
+            template._fast_render = self.try_specialize(template)
+            template._fast_render_key = key
+        return template._fast_render
+
+    def _part_renderer(self, template_format: TemplateFormat, source: str) -> Callable[[Mapping[str, Any]], str]:
+        """Return a function rendering one template part, compiling it up front."""
+        if template_format == TemplateFormat.JINJA2:
+            if self.use_legacy:
+                return partial(self.render_jinja2, source)
+            if "{{" not in source and "{%" not in source and "{#" not in source:
+                return lambda context: source
+            return self._compile(source).render
+        if template_format == TemplateFormat.MUSTACHE:
+            return partial(self.render_mustache, source)
+        return lambda context: source  # Plain text, no rendering
 
     def render(self, template: Template, context: Dict[str, Any]) -> RenderedTemplate:
         """Render a template with context."""
-        # Merge defaults
-        full_context = {**template.get_variable_defaults(), **context}
-
-        # Validate required variables
-        missing = template.get_required_variables() - set(full_context.keys())
-        if missing:
-            raise ValueError(f"Missing required variables: {missing}")
-
-        # Choose rendering method
-        if template.format == TemplateFormat.JINJA2:
-            render_fn = self.render_jinja2
-        elif template.format == TemplateFormat.MUSTACHE:
-            render_fn = self.render_mustache
-        else:
-            render_fn = lambda t, c: t  # Plain text, no rendering
-
-        rendered = RenderedTemplate(
-            template_id=template.id,
-            locale=template.locale,
-            variables_used=full_context
-        )
-
-        if template.subject:
-            rendered.subject = render_fn(template.subject, full_context)
+        return self.render_many(template, [context])[0]
+
+    def render_many(self, template: Template, contexts: Iterable[Dict[str, Any]]) -> List[RenderedTemplate]:
+        """Render a template once per context, compiling its parts only once."""
+        defaults = template.variable_defaults
+        required = template.required_variables
+        fast_render = self._specialized(template) if self.use_legacy else None
+        render_subject = self._part_renderer(template.format, template.subject) if template.subject else None
+        render_body = self._part_renderer(template.format, template.body)
+        render_html = self._part_renderer(template.format, template.html_body) if template.html_body else None
+
+        results = []
+        for context in contexts:
+            # Merge defaults
+            variables = {**defaults, **context}
+
+            # Validate required variables
+            missing = {name for name in required if name not in variables}
+            if missing:
+                raise ValueError(f"Missing required variables: {missing}")
+
+            rendered = RenderedTemplate(
+                template_id=template.id,
+                locale=template.locale,
+                variables_used=variables
+            )
+            if fast_render is not None:
+                rendered.subject, rendered.body, rendered.html_body = fast_render(
+                    ChainMap(variables, self.globals), self
+                )
+            else:
+                if render_subject:
+                    rendered.subject = render_subject(variables)
+                rendered.body = render_body(variables)
+                if render_html:
+                    rendered.html_body = render_html(variables)
+            results.append(rendered)
 
-        rendered.body = render_fn(template.body, full_context)
+        return results
 
-        if template.html_body:
-            rendered.html_body = render_fn(template.html_body, full_context)
 
-        return rendered
+# Shared by every TemplateManager that does not customise its engine. Its
+# filters and globals are read-only; managers clone it on first write.
+_DEFAULT_ENGINE = TemplateEngine()
+_DEFAULT_ENGINE.filters = MappingProxyType(dict(_DEFAULT_ENGINE.filters))
+_DEFAULT_ENGINE.globals = MappingProxyType(dict(_DEFAULT_ENGINE.globals))
 
 
 class TemplateStore:
@@ -348,6 +816,8 @@ class TemplateStore:
     def __init__(self):
         self.templates: Dict[str, Dict[str, Template]] = {}  # id -> locale -> template
         self.categories: Dict[str, Set[str]] = {}  # category -> template_ids
+        self.by_type: Dict[TemplateType, Dict[str, Dict[str, Template]]] = {}  # type -> id -> locale -> template
+        self._indexed_types: Dict[Tuple[str, str], TemplateType] = {}  # (id, locale) -> type in by_type
 
     def save(self, template: Template) -> None:
         """Save a template."""
@@ -355,7 +825,13 @@ class TemplateStore:
             self.templates[template.id] = {}
 
         template.updated_at = datetime.now()
+        template._index_variables()
+        template._fast_render_key = None
+        template._revision = next(_SAVE_REVISIONS)
+        self._unindex_type(template.id, template.locale)
         self.templates[template.id][template.locale] = template
+        self.by_type.setdefault(template.template_type, {}).setdefault(template.id, {})[template.locale] = template
+        self._indexed_types[(template.id, template.locale)] = template.template_type
 
         # Update categories
         category = template.metadata.get("category", "default")
@@ -376,22 +852,36 @@ class TemplateStore:
             return False
 
         if locale:
-            self.templates[template_id].pop(locale, None)
+            if self.templates[template_id].pop(locale, None) is not None:
+                self._unindex_type(template_id, locale)
             if not self.templates[template_id]:
                 del self.templates[template_id]
         else:
-            del self.templates[template_id]
+            for template_locale in self.templates.pop(template_id):
+                self._unindex_type(template_id, template_locale)
 
         return True
 
+    def _unindex_type(self, template_id: str, locale: str) -> None:
+        """Remove a template from the type index under the type it was indexed with."""
+        template_type = self._indexed_types.pop((template_id, locale), None)
+        if template_type is None:
+            return
+        by_id = self.by_type.get(template_type, {})
+        locales = by_id.get(template_id, {})
+        locales.pop(locale, None)
+        if not locales:
+            by_id.pop(template_id, None)
+        if not by_id:
+            self.by_type.pop(template_type, None)
+
     def list_by_type(self, template_type: TemplateType) -> List[Template]:
         """List templates by type."""
-        result = []
-        for locales in self.templates.values():
-            for template in locales.values():
-                if template.template_type == template_type:
-                    result.append(template)
-        return result
+        return [
+            template
+            for locales in self.by_type.get(template_type, {}).values()
+            for template in locales.values()
+        ]
 
     def list_by_category(self, category: str) -> List[Template]:
         """List templates by category."""
@@ -405,12 +895,32 @@ class TemplateStore:
 
 
 class TemplateManager:
-    """High-level template management."""
+    """High-level template management.
 
-    def __init__(self):
+    Managers created without an engine render with the shared default
+    engine until they are customised: add_filter, set_global or reading
+    the engine attribute give the manager its own clone first, so
+    manager.engine.add_filter(...) only affects that manager.
+    """
+
+    def __init__(self, engine: Optional[TemplateEngine] = None, cache_size: int = 256):
         self.store = TemplateStore()
-        self.engine = TemplateEngine()
+        self._engine = engine or _DEFAULT_ENGINE
         self.locale_fallbacks: Dict[str, str] = {}
+        self.cache_size = cache_size
+        self._render_cache: "OrderedDict[Tuple[Any, ...], RenderedTemplate]" = OrderedDict()
+
+    @property
+    def engine(self) -> TemplateEngine:
+        """This manager's engine, cloned from the shared default on first access."""
+        if self._engine is _DEFAULT_ENGINE:
+            self._engine = self._engine.clone()
+        return self._engine
+
+    @engine.setter
+    def engine(self, engine: TemplateEngine) -> None:
+        self._engine = engine
+        self._render_cache.clear()
 
     def register_template(
         self,
@@ -437,15 +947,66 @@ class TemplateManager:
             metadata=metadata
         )
         self.store.save(template)
+        self._render_cache.clear()
         return template
 
     def render(
         self,
         template_id: str,
         context: Dict[str, Any],
-        locale: Optional[str] = None
+        locale: Optional[str] = None,
+        cache: bool = True
     ) -> RenderedTemplate:
-        """Render a template."""
+        """Render a template.
+
+        Renders of plain-data contexts are memoised per saved template
+        revision and engine state; pass cache=False to always render afresh.
+        """
+        # Determine locale with fallback
+        if locale and locale in self.locale_fallbacks:
+            locale = self.locale_fallbacks[locale]
+
+        template = self.store.get(template_id, locale or "en")
+        if not template:
+            raise ValueError(f"Template not found: {template_id}")
+
+        if not cache or self.cache_size <= 0:
+            return self._engine.render(template, context)
+
+        try:
+            key = (
+                template.id,
+                template.locale,
+                template.version,
+                template._revision,
+                id(self._engine),
+                self._engine.revision,
+                _freeze(context),
+            )
+        except TypeError:
+            return self._engine.render(template, context)
+
+        cached = self._render_cache.get(key)
+        if cached is not None:
+            self._render_cache.move_to_end(key)
+            rendered = copy.copy(cached)
+            rendered.rendered_at = None
+            rendered.variables_used = {**template.variable_defaults, **context}
+            return rendered
+
+        rendered = self._engine.render(template, context)
+        self._render_cache[key] = rendered
+        if len(self._render_cache) > self.cache_size:
+            self._render_cache.popitem(last=False)
+        return copy.copy(rendered)
+
+    def render_many(
+        self,
+        template_id: str,
+        contexts: Iterable[Dict[str, Any]],
+        locale: Optional[str] = None
+    ) -> List[RenderedTemplate]:
+        """Render a template for each context in a batch."""
         # Determine locale with fallback
         if locale and locale in self.locale_fallbacks:
             locale = self.locale_fallbacks[locale]
@@ -454,7 +1015,7 @@ class TemplateManager:
         if not template:
             raise ValueError(f"Template not found: {template_id}")
 
-        return self.engine.render(template, context)
+        return self._engine.render_many(template, contexts)
 
     def preview(
         self,
@@ -476,15 +1037,17 @@ class TemplateManager:
             else:
                 context[var.name] = f"[{var.name}]"
 
-        return self.engine.render(template, context)
+        return self._engine.render(template, context)
 
     def add_filter(self, name: str, fn: Callable) -> None:
         """Add custom template filter."""
         self.engine.add_filter(name, fn)
+        self._render_cache.clear()
 
     def set_global(self, name: str, value: Any) -> None:
         """Set global template variable."""
         self.engine.add_global(name, value)
+        self._render_cache.clear()
 
     def set_locale_fallback(self, locale: str, fallback: str) -> None:
         """Set locale fallback chain."""
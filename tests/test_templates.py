@@ -0,0 +1,381 @@
+import dataclasses
+import json
+from datetime import datetime
+
+import pytest
+
+from roadtemplates import templates as templates_module
+from roadtemplates.templates import (
+    EmailTemplates,
+    RenderedTemplate,
+    Template,
+    TemplateEngine,
+    TemplateFormat,
+    TemplateManager,
+    TemplateStore,
+    TemplateType,
+    TemplateVariable,
+    _DEFAULT_ENGINE,
+    jinja2,
+)
+
+needs_jinja2 = pytest.mark.skipif(jinja2 is None, reason="jinja2 not installed")
+
+
+def render_jinja2(source, context):
+    engine = TemplateEngine()
+    return engine._part_renderer(TemplateFormat.JINJA2, source)(context)
+
+
+@needs_jinja2
+def test_jinja2_filters_on_missing_values_render_blank():
+    assert render_jinja2("[{{ missing | upper }}]", {}) == "[]"
+    assert render_jinja2("[{{ user.name | title }}]", {"user": {}}) == "[]"
+    assert render_jinja2("[{{ user.name | title }}]", {}) == "[]"
+
+
+@needs_jinja2
+def test_jinja2_none_renders_blank():
+    assert render_jinja2("[{{ n }}]", {"n": None}) == "[]"
+
+
+def test_missing_jinja2_falls_back_with_warning(monkeypatch, caplog):
+    monkeypatch.setattr(templates_module, "jinja2", None)
+    engine = TemplateEngine()
+    assert engine.use_legacy
+    assert "jinja2 is not installed" in caplog.text
+
+
+@needs_jinja2
+def test_jinja2_mapping_keys_win_over_attributes():
+    assert render_jinja2("{{ obj.items }}", {"obj": {"items": "I"}}) == "I"
+    assert render_jinja2("[{{ obj.keys }}]", {"obj": {}}) == "[]"
+
+
+@needs_jinja2
+def test_jinja2_compile_cache_is_bounded():
+    engine = TemplateEngine(cache_size=2)
+    for i in range(5):
+        engine._compile(f"{{{{ x }}}}{i}")
+    assert len(engine._compiled) == 2
+    assert list(engine._compiled) == ["{{ x }}3", "{{ x }}4"]
+
+
+@pytest.mark.parametrize("first, second", [
+    (1, True),
+    (1, 1.0),
+    ([1], (1,)),
+    ({1: "a"}, {True: "a"}),
+])
+def test_render_cache_distinguishes_equal_values_of_different_types(first, second):
+    manager = TemplateManager()
+    manager.register_template("t", "T", TemplateType.TEXT, "v={{ v }}")
+    manager.render("t", {"v": first})
+    cached = manager.render("t", {"v": second})
+    fresh = manager.render("t", {"v": second}, cache=False)
+    assert cached.body == fresh.body
+
+
+def test_list_by_type_follows_type_change_on_resave():
+    store = TemplateStore()
+    template = Template(id="t", name="T", template_type=TemplateType.EMAIL, body="hi")
+    store.save(template)
+    template.template_type = TemplateType.SMS
+    store.save(template)
+    assert store.list_by_type(TemplateType.EMAIL) == []
+    assert store.list_by_type(TemplateType.SMS) == [template]
+
+
+def test_list_by_type_after_delete():
+    store = TemplateStore()
+    store.save(Template(id="t", name="T", template_type=TemplateType.EMAIL, body="hi"))
+    store.save(Template(id="t", name="T", template_type=TemplateType.EMAIL, body="hola", locale="es"))
+    store.delete("t", "es")
+    assert [t.locale for t in store.list_by_type(TemplateType.EMAIL)] == ["en"]
+    store.delete("t")
+    assert store.list_by_type(TemplateType.EMAIL) == []
+    assert store.by_type == {}
+
+
+def test_rendered_at_is_a_lazy_dataclass_field():
+    stamp = datetime(2024, 1, 2, 3, 4, 5)
+    assert RenderedTemplate("x", rendered_at=stamp).rendered_at == stamp
+    assert "rendered_at" in [f.name for f in dataclasses.fields(RenderedTemplate)]
+    assert "rendered_at=datetime.datetime(2024" in repr(RenderedTemplate("x", rendered_at=stamp))
+
+    rendered = RenderedTemplate("x")
+    assert rendered._rendered_at is None
+    first = rendered.rendered_at
+    assert isinstance(first, datetime)
+    assert rendered.rendered_at is first
+
+
+@pytest.mark.parametrize("cache", [False, True])
+def test_variables_used_is_a_detached_plain_dict(cache):
+    manager = TemplateManager()
+    manager.register_template(
+        "t", "T", TemplateType.TEXT, "{{ a }}{{ b }}",
+        variables=[{"name": "b", "default": "B"}],
+    )
+    context = {"a": "A"}
+    manager.render("t", context, cache=cache)
+    rendered = manager.render("t", context, cache=cache)
+    assert type(rendered.variables_used) is dict
+    assert json.loads(json.dumps(rendered.variables_used)) == {"a": "A", "b": "B"}
+    rendered.variables_used["a"] = "changed"
+    assert context == {"a": "A"}
+
+
+def test_manager_engine_can_be_customised_directly():
+    manager = TemplateManager()
+    other = TemplateManager()
+    manager.engine.add_filter("shout", lambda s: s + "!")
+    manager.engine.add_global("who", "world")
+    manager.register_template("t", "T", TemplateType.TEXT, "{{ who | shout }}")
+    other.register_template("t", "T", TemplateType.TEXT, "[{{ who }}]")
+    assert manager.render("t", {}).body == "world!"
+    assert other.render("t", {}).body == "[]"
+    assert "shout" not in _DEFAULT_ENGINE.filters
+
+
+def test_shared_default_engine_is_read_only():
+    with pytest.raises(TypeError, match="read-only"):
+        _DEFAULT_ENGINE.add_filter("shout", str.upper)
+    with pytest.raises(TypeError, match="read-only"):
+        _DEFAULT_ENGINE.add_global("who", "world")
+
+
+CONDITION_CONTEXT = {
+    "status": "active", "n": 5, "s": "7", "u": {"name": "Al"}, "e": [], "zs": "0",
+    "t": "x", "a": 1, "b": 0, "c": "", "active": "", "f": False, "nn": None,
+}
+
+
+@pytest.mark.parametrize("condition, expected", [
+    ("status == 'active'", True),
+    ("status == active", True),  # bare right-hand side is a literal, not a variable
+    ("status==active", True),
+    ('status != "active"', False),
+    ("n > 3", True),
+    ("s >= 7", True),
+    ("n <= 5.0", True),
+    ('n == "5"', True),
+    ("u.name", True),
+    ("u.nope", False),
+    ("u.name | lower == al", True),
+    ("not a and b", True),  # not (a and b)
+    ("a or b and c", False),  # (a or b) and c
+    ("a and b or a", True),  # a and (b or a)
+    ("n < 2 or not u.name", False),
+    ("e", True),  # an empty list renders as "[]"
+    ("zs", False),
+    ("f", False),
+    ("nn", False),
+    ("missing", False),
+])
+def test_condition_semantics(condition, expected):
+    engine = TemplateEngine(use_legacy=True)
+    assert engine._evaluate_condition(condition, CONDITION_CONTEXT) is expected
+
+
+RENDER_CONTEXT = {
+    "items": [{"n": "a", "v": 1}, {"n": "b", "v": 5}],
+    "price": 1234.5,
+    "t": "abcdef",
+    "s": " Hello World! ",
+    "show": True,
+    "xs": ["p", "q", "r"],
+    "user": {"name": "al", "tags": ["x", "y"]},
+    "empty": [],
+}
+
+
+# Expected output matches the original pass-based renderer.
+@pytest.mark.parametrize("source, expected", [
+    (
+        "{% for i in items %}{{ loop.index }}/{{ loop.length }}:{{ i.n | upper }}"
+        "{% if loop.first %}^{% endif %}{% if loop.last %}${% endif %},{% endfor %}",
+        "1/2:A^,2/2:B$,",
+    ),
+    ("{% for i in items %}{% if i.v > 2 %}big{% else %}small{% endif %}{% endfor %}", "smallbig"),
+    (
+        "{% if show %}<ul>{% for x in xs %}<li>{{ x }}</li>{% endfor %}</ul>{% else %}none{% endif %}",
+        "<ul><li>p</li><li>q</li><li>r</li></ul>",
+    ),
+    ("{% for tag in user.tags %}{{ user.name | title }}#{{ tag }} {% endfor %}", "Al#x Al#y "),
+    ("{% for x in empty %}never{% endfor %}done", "done"),
+    (
+        "{{ price | currency('€') }}|{{ price | currency }}|{{ t | truncate(3) }}|{{ t | truncate }}"
+        "|{{ s | slugify }}|{{ s | strip | upper }}|{{ missing | default('dflt') }}",
+        "€1,234.50|$1,234.50|abc...|abcdef|hello-world|HELLO WORLD!|dflt",
+    ),
+    ('{{ user.name | default("x", ) }}|{{ t | truncate(2) | upper }}', "al|AB..."),
+    ("{% if not show %}a{% else %}b{% endif %}{% if user.name == al %}eq{% endif %}", "beq"),
+    ("plain text", "plain text"),
+])
+def test_legacy_jinja2_rendering(source, expected):
+    engine = TemplateEngine(use_legacy=True)
+    assert engine.render_jinja2(source, RENDER_CONTEXT) == expected
+
+
+def test_legacy_jinja2_renders_identical_blocks_independently():
+    engine = TemplateEngine(use_legacy=True)
+    source = "{% if a %}X{% endif %}{% if b %}X{% endif %}|{% if b %}X{% endif %}{% if a %}X{% endif %}"
+    assert engine.render_jinja2(source, {"a": 1, "b": 0}) == "X|X"
+
+
+def test_legacy_jinja2_does_not_render_tags_inside_values():
+    engine = TemplateEngine(use_legacy=True)
+    context = {"xs": ["{{ secret }}"], "evil": "{% if 1 %}{{ secret }}{% endif %}", "secret": "S"}
+    assert engine.render_jinja2("{% for x in xs %}{{ x }}{% endfor %}|{{ evil }}", context) == (
+        "{{ secret }}|{% if 1 %}{{ secret }}{% endif %}"
+    )
+
+
+def test_mustache_rendering():
+    engine = TemplateEngine(use_legacy=True)
+    source = "{{#items}}<{{n}}>{{/items}}{{^none}}empty{{/none}}{{name}} {{{name}}}"
+    context = {"items": [{"n": "x"}, {"n": "y"}], "name": "<b>"}
+    assert engine.render_mustache(source, context) == "<x><y>empty&lt;b&gt; <b>"
+
+
+@pytest.mark.parametrize("register, context", [
+    (
+        EmailTemplates.welcome,
+        {"user": {"name": "Alice", "email": "a@example.com"}, "verification_link": "https://v"},
+    ),
+    (EmailTemplates.welcome, {"user": {"name": "Alice", "email": "a@example.com"}}),
+    (EmailTemplates.password_reset, {"user": {"name": "Bob"}, "reset_link": "https://r"}),
+])
+def test_specialised_render_matches_interpreter(register, context):
+    engine = TemplateEngine(use_legacy=True)
+    manager = TemplateManager(engine)
+    manager.set_global("app_name", "BlackRoad")
+    template = register(manager)
+
+    fast = engine.render(template, context)
+    assert template._fast_render is not None
+
+    template._fast_render = None
+    template._fast_render_key = (template.format, template.subject, template.body, template.html_body)
+    slow = engine.render(template, context)
+
+    assert (fast.subject, fast.body, fast.html_body) == (slow.subject, slow.body, slow.html_body)
+
+
+def test_specialised_welcome_email_output():
+    engine = TemplateEngine(use_legacy=True)
+    manager = TemplateManager(engine)
+    EmailTemplates.welcome(manager)
+    rendered = manager.render("email.welcome", {
+        "user": {"name": "Alice", "email": "a@example.com"},
+        "verification_link": "https://v",
+    })
+    assert rendered.subject == "Welcome to BlackRoad, Alice!"
+    assert rendered.body == (
+        "Hi Alice,\n\nWelcome to BlackRoad! We're excited to have you on board.\n\n"
+        "Your account has been created with the email: a@example.com\n\n\n"
+        "Please verify your email by clicking the link below:\nhttps://v\n\n\n"
+        "Best regards,\nThe BlackRoad Team"
+    )
+    assert '<p><a href="https://v">Verify your email</a></p>' in rendered.html_body
+
+
+def test_specialised_render_follows_body_edits():
+    engine = TemplateEngine(use_legacy=True)
+    template = Template(id="t", name="T", template_type=TemplateType.TEXT, body="v1 {{ a }}")
+    assert engine.render(template, {"a": 1}).body == "v1 1"
+    template.body = "v2 {{ a }}"
+    assert engine.render(template, {"a": 1}).body == "v2 1"
+
+
+def test_templates_with_loops_are_not_specialised():
+    engine = TemplateEngine(use_legacy=True)
+    template = Template(id="t", name="T", template_type=TemplateType.TEXT, body="{% for x in xs %}{{ x }}{% endfor %}")
+    assert engine.try_specialize(template) is None
+    assert engine.render(template, {"xs": [1, 2]}).body == "12"
+
+
+def test_render_cache_sees_engine_changes():
+    manager = TemplateManager()
+    manager.register_template("t", "T", TemplateType.TEXT, "hi {{ who }}")
+    assert manager.render("t", {}).body == "hi "
+    manager.engine.add_global("who", "world")
+    assert manager.render("t", {}).body == "hi world"
+    manager.register_template("s", "S", TemplateType.TEXT, "{{ who | upper }}")
+    assert manager.render("s", {}).body == "WORLD"
+    manager.engine.add_filter("upper", lambda s: s + "?")
+    assert manager.render("s", {}).body == "world?"
+
+
+def test_render_cache_sees_resaved_templates():
+    manager = TemplateManager()
+    template = manager.register_template("t", "T", TemplateType.TEXT, "v1 {{ a }}")
+    assert manager.render("t", {"a": 1}).body == "v1 1"
+
+    template.body = "v2 {{ a }}"
+    manager.store.save(template)
+    assert manager.render("t", {"a": 1}).body == "v2 1"
+
+    manager.store.save(Template(id="t", name="T", template_type=TemplateType.TEXT, body="v3 {{ a }}"))
+    assert manager.render("t", {"a": 1}).body == "v3 1"
+
+
+@pytest.mark.parametrize("use_legacy", [True, False])
+def test_render_many_matches_repeated_render(use_legacy):
+    manager = TemplateManager(TemplateEngine(use_legacy=use_legacy))
+    EmailTemplates.welcome(manager)
+    contexts = [
+        {"user": {"name": "Alice", "email": "a@example.com"}, "verification_link": "https://v"},
+        {"user": {"name": "Bob", "email": "b@example.com"}},
+    ]
+    batch = manager.render_many("email.welcome", contexts)
+    single = [manager.render("email.welcome", context, cache=False) for context in contexts]
+    assert [(r.subject, r.body, r.html_body, r.variables_used) for r in batch] == [
+        (r.subject, r.body, r.html_body, r.variables_used) for r in single
+    ]
+
+
+def test_render_many_names_missing_variables():
+    manager = TemplateManager()
+    manager.register_template(
+        "t", "T", TemplateType.TEXT, "{{ a }}",
+        variables=[{"name": "a", "required": True}],
+    )
+    with pytest.raises(ValueError, match="'a'"):
+        manager.render_many("t", [{"a": 1}, {}])
+
+
+def test_render_many_uses_locale_fallback():
+    manager = TemplateManager()
+    manager.register_template("t", "T", TemplateType.TEXT, "hello {{ who }}")
+    manager.register_template("t", "T", TemplateType.TEXT, "bonjour {{ who }}", locale="fr")
+    manager.set_locale_fallback("fr-CA", "fr")
+    rendered = manager.render_many("t", [{"who": "Ann"}], locale="fr-CA")
+    assert [r.body for r in rendered] == ["bonjour Ann"]
+    assert rendered[0].locale == "fr"
+
+
+def test_render_many_accepts_a_generator():
+    manager = TemplateManager()
+    manager.register_template("t", "T", TemplateType.TEXT, "#{{ n }}")
+    rendered = manager.render_many("t", ({"n": n} for n in range(3)))
+    assert [r.body for r in rendered] == ["#0", "#1", "#2"]
+
+
+def test_variable_index_follows_version_bumps_and_saves():
+    template = Template(
+        id="t", name="T", template_type=TemplateType.TEXT, body="{{ a }}{{ b }}",
+        variables=[TemplateVariable("a")],
+    )
+    assert template.required_variables == {"a"}
+
+    template.variables.append(TemplateVariable("b", required=False, default="B"))
+    template.version += 1
+    assert template.required_variables == {"a"}
+    assert template.variable_defaults == {"b": "B"}
+
+    template.variables[0] = TemplateVariable("a", required=False, default="A")
+    TemplateStore().save(template)
+    assert template.required_variables == frozenset()
+    assert template.variable_defaults == {"a": "A", "b": "B"}